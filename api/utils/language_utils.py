@@ -18,6 +18,111 @@ Language detection utilities for multi-language support.
 Detects English, Japanese, and Vietnamese without external dependencies.
 """
 import re
+from functools import lru_cache
+
+# Quoted text (double quotes, single quotes, and CJK quotes) as (opening mark, pattern)
+# Pattern matches: "text", 'text', 「text」, 『text』, etc.
+# Applied one after another in this order, so double-quoted spans are removed before
+# apostrophes inside them could pair up as single quotes
+_QUOTE_PATTERNS = (
+    ('"', re.compile(r'"[^"]*"')),                          # Double quotes
+    ("'", re.compile(r"'[^']*'")),                          # Single quotes
+    ('「', re.compile(r'「[^」]*」')),                        # Japanese corner brackets
+    ('『', re.compile(r'『[^』]*』')),                        # Japanese white corner brackets
+    ('\u201c', re.compile('\u201c[^\u201d]*\u201d')),       # CJK double quotes (U+201C and U+201D)
+    ('\u2018', re.compile('\u2018[^\u2019]*\u2019')),       # CJK single quotes (U+2018 and U+2019)
+)
+
+# Repeated questions are detected once per stage of the chat pipeline, so results are
+# memoized; texts longer than this bypass the caches to avoid pinning large strings
+_CACHE_MAX_TEXT_LEN = 2048
+_CACHE_SIZE = 4096
+
+# Ratio-based detection is settled well within this many characters; longer texts
+# (e.g. whole chunk contents) are sampled from their start, middle and end
+_DETECT_SAMPLE_LEN = 2048
+
+# Acronyms/initialisms (all-caps words of 2-5 characters) like NDA, NASA, PIN
+_ACRONYM_RE = re.compile(r'\b[A-Z]{2,5}\b')
+# Same pattern with ASCII word boundaries: cheaper, and equivalent on pure-ASCII text
+# (on other text it would split words at accented letters, e.g. "VIỆT" -> "ỆT")
+_ACRONYM_ASCII_RE = re.compile(r'\b[A-Z]{2,5}\b', re.ASCII)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Tier 1: Absolutely unique to Vietnamese (ă, đ, ơ, ư and their combinations with tones)
+_VIETNAMESE_UNIQUE_CHARS = (
+    'ăđơưĂĐƠƯ'  # Unique Vietnamese base letters
+    'ặẳẵắằậẩẫấầ'  # ă with tone marks
+    'ợởỡớờộổỗốồ'  # ơ, ô with Vietnamese-specific tones
+    'ựửữứừ'  # ư with tone marks
+    'ẶẲẴẮẰẬẨẪẤẦ'  # Uppercase Ă with tone marks
+    'ỢỞỠỚỜỘỔỖỐỒ'  # Uppercase Ơ, Ô with Vietnamese-specific tones
+    'ỰỬỮỨỪ'  # Uppercase Ư with tone marks
+)
+
+# Tier 2: Common in Vietnamese but also in French/Spanish
+_VIETNAMESE_COMMON_CHARS = (
+    'ạảẹẻịỉọỏụủỵỷ'  # Dot below, hook above (lowercase)
+    'ẠẢẸẺỊỈỌỎỤỦỴỶ'  # Dot below, hook above (uppercase)
+)
+
+_VIETNAMESE_UNIQUE_CODEPOINTS = frozenset(map(ord, _VIETNAMESE_UNIQUE_CHARS))
+_VIETNAMESE_COMMON_CODEPOINTS = frozenset(map(ord, _VIETNAMESE_COMMON_CHARS))
+
+# Character categories, stored as the values of the lookup table below
+(
+    _OTHER,
+    _HIRAGANA,
+    _KATAKANA,
+    _KANJI,
+    _VIETNAMESE_UNIQUE,
+    _VIETNAMESE_COMMON,
+    _ASCII_LETTER,
+) = range(7)
+
+# str.translate maps every character to its category byte in one C loop; the
+# resulting one-character markers are then tallied with str.count / `in`
+_HIRAGANA_MARKER = chr(_HIRAGANA)
+_KATAKANA_MARKER = chr(_KATAKANA)
+_KANJI_MARKER = chr(_KANJI)
+_VIETNAMESE_UNIQUE_MARKER = chr(_VIETNAMESE_UNIQUE)
+_VIETNAMESE_COMMON_MARKER = chr(_VIETNAMESE_COMMON)
+_ASCII_LETTER_MARKER = chr(_ASCII_LETTER)
+
+
+# Contiguous codepoint ranges (inclusive), sorted by start; new categories only need a row here
+_CATEGORY_RANGES = (
+    (0x0041, 0x005A, _ASCII_LETTER),  # A-Z
+    (0x0061, 0x007A, _ASCII_LETTER),  # a-z
+    (0x3040, 0x309F, _HIRAGANA),  # Hiragana
+    (0x30A0, 0x30FF, _KATAKANA),  # Katakana
+    (0x4E00, 0x9FFF, _KANJI),  # CJK Unified Ideographs
+)
+
+
+def _build_category_table() -> bytes:
+    """Build a lookup table mapping every BMP codepoint to its character category."""
+    table = bytearray(0x10000)
+    for start, end, category in _CATEGORY_RANGES:
+        table[start:end + 1] = bytes([category]) * (end - start + 1)
+    for o in _VIETNAMESE_UNIQUE_CODEPOINTS:
+        table[o] = _VIETNAMESE_UNIQUE
+    for o in _VIETNAMESE_COMMON_CODEPOINTS:
+        table[o] = _VIETNAMESE_COMMON
+    return bytes(table)
+
+
+# Codepoints beyond the BMP fall outside the table and are treated as _OTHER
+_CATEGORY_TABLE = _build_category_table()
+
+
+def _strip_quotes(text: str) -> str:
+    """Remove quoted spans, skipping each pattern whose opening mark is not present."""
+    for opener, pattern in _QUOTE_PATTERNS:
+        if opener in text:
+            text = pattern.sub('', text)
+    return text
 
 
 def extract_first_sentence_for_detection(text: str, max_chars: int = 50) -> str:
@@ -42,20 +147,33 @@ def extract_first_sentence_for_detection(text: str, max_chars: int = 50) -> str:
         >>> extract_first_sentence_for_detection("機械学習とは何ですか？次の文。")
         '機械学習とは何ですか？'
     """
-    if not text or not text.strip():
+    if text and len(text) > _CACHE_MAX_TEXT_LEN:
+        return _extract_first_sentence(text, max_chars)
+    return _extract_first_sentence_cached(text, max_chars)
+
+
+def _extract_first_sentence(text: str, max_chars: int) -> str:
+    """Uncached implementation of extract_first_sentence_for_detection."""
+    if not text:
         return ""
     
     text = text.strip()
+    if not text:
+        return ""
     
-    # Find first sentence by delimiter (\n or .)
+    # Find first sentence by delimiter (\n or .), using len(text) as the "not found" sentinel
     first_sentence = text
+    text_len = len(text)
     newline_pos = text.find('\n')
-    period_pos = text.find('.')
+    if newline_pos < 0:
+        newline_pos = text_len
+    period_pos = text.find('.', 0, newline_pos)
+    if period_pos < 0:
+        period_pos = text_len
     
     # Determine the earliest delimiter position
-    delimiters = [pos for pos in [newline_pos, period_pos] if pos != -1]
-    if delimiters:
-        first_delim = min(delimiters)
+    first_delim = min(newline_pos, period_pos)
+    if first_delim < text_len:
         first_sentence = text[:first_delim + 1]  # Include the delimiter
     
     # Apply max character limit
@@ -63,29 +181,21 @@ def extract_first_sentence_for_detection(text: str, max_chars: int = 50) -> str:
         first_sentence = first_sentence[:max_chars]
     
     # Remove quoted text (double quotes, single quotes, and CJK quotes)
-    # Pattern matches: "text", 'text', 「text」, 『text』, etc.
-    quote_patterns = [
-        r'"[^"]*"',                    # Double quotes
-        r"'[^']*'",                    # Single quotes
-        r'「[^」]*」',                  # Japanese corner brackets
-        r'『[^』]*』',                  # Japanese white corner brackets
-        r'"[^"]*"',                    # CJK double quotes
-        '\u2018[^\u2019]*\u2019',      # CJK single quotes (U+2018 and U+2019)
-    ]
-    
-    for pattern in quote_patterns:
-        first_sentence = re.sub(pattern, '', first_sentence)
+    first_sentence = _strip_quotes(first_sentence)
     
     # Remove acronyms/initialisms (all-caps words of 2-5 characters)
-    # Matches standalone uppercase words like NDA, NASA, PIN
-    first_sentence = re.sub(r'\b[A-Z]{2,5}\b', '', first_sentence)
+    acronym_re = _ACRONYM_ASCII_RE if first_sentence.isascii() else _ACRONYM_RE
+    first_sentence = acronym_re.sub('', first_sentence)
     
     # Clean up extra whitespace
-    first_sentence = re.sub(r'\s+', ' ', first_sentence).strip()
+    first_sentence = _WHITESPACE_RE.sub(' ', first_sentence).strip()
     
     return first_sentence
 
 
+_extract_first_sentence_cached = lru_cache(maxsize=_CACHE_SIZE)(_extract_first_sentence)
+
+
 def detect_language(text: str) -> str:
     """
     Detect language of text with support for English, Japanese, and Vietnamese only.
@@ -105,92 +215,86 @@ def detect_language(text: str) -> str:
         >>> detect_language("Học máy là gì?")
         'Vietnamese'
     """
-    if not text or not text.strip():
+    if text and len(text) > _CACHE_MAX_TEXT_LEN:
+        return _detect_language(text)
+    return _detect_language_cached(text)
+
+
+def _detect_language(text: str) -> str:
+    """Uncached implementation of detect_language."""
+    if not text or text.isspace():
         return None
     
-    # Count characters by type for confidence scoring
-    char_counts = {
-        'hiragana': 0,
-        'katakana': 0,
-        'kanji': 0,  # CJK Unified Ideographs (shared with Chinese, but in context indicates Japanese)
-        'vietnamese_unique': 0,  # Truly unique Vietnamese characters
-        'vietnamese_common': 0,   # Vietnamese tone marks that might appear in other languages
-        'ascii': 0,
-        'total': 0
-    }
-    
-    # Tier 1: Absolutely unique to Vietnamese (ă, đ, ơ, ư and their combinations with tones)
-    vietnamese_unique = set(
-        'ăđơưĂĐƠƯ'  # Unique Vietnamese base letters
-        'ặẳẵắằậẩẫấầ'  # ă with tone marks
-        'ợởỡớờộổỗốồ'  # ơ, ô with Vietnamese-specific tones
-        'ựửữứừ'  # ư with tone marks
-        'ẶẲẴẮẰẬẨẪẤẦ'  # Uppercase Ă with tone marks
-        'ỢỞỠỚỜỘỔỖỐỒ'  # Uppercase Ơ, Ô with Vietnamese-specific tones
-        'ỰỬỮỨỪ'  # Uppercase Ư with tone marks
-    )
-    
-    # Tier 2: Common in Vietnamese but also in French/Spanish (need multiple occurrences)
-    vietnamese_common = set(
-        'ạảẹẻịỉọỏụủỵỷ'  # Dot below, hook above (lowercase)
-        'ẠẢẸẺỊỈỌỎỤỦỴỶ'  # Dot below, hook above (uppercase)
-    )
-    
-    for char in text:
-        char_counts['total'] += 1
-        
-        # Japanese detection (Hiragana, Katakana, and Kanji)
-        if '\u3040' <= char <= '\u309F':  # Hiragana
-            char_counts['hiragana'] += 1
-        elif '\u30A0' <= char <= '\u30FF':  # Katakana
-            char_counts['katakana'] += 1
-        elif '\u4E00' <= char <= '\u9FFF':  # CJK Unified Ideographs (Kanji/Hanzi)
-            char_counts['kanji'] += 1
-        
-        # Vietnamese character detection (two-tier)
-        elif char in vietnamese_unique:
-            char_counts['vietnamese_unique'] += 1
-        elif char in vietnamese_common:
-            char_counts['vietnamese_common'] += 1
-        
-        # ASCII (English)
-        elif ord(char) < 128 and char.isalpha():
-            char_counts['ascii'] += 1
+    text_len = len(text)
+    if text_len > _DETECT_SAMPLE_LEN:
+        window = _DETECT_SAMPLE_LEN // 3
+        middle = (text_len - window) // 2
+        text = text[:window] + text[middle:middle + window] + text[-window:]
     
-    # Calculate confidence percentages
-    total_chars = char_counts['total']
-    if total_chars == 0:
-        return None
+    # Pure-ASCII text cannot contain kana, kanji or Vietnamese letters: it is English
+    # as soon as it has one letter (the only ASCII characters that change case)
+    if text.isascii():
+        return "English" if text.lower() != text.upper() else None
     
-    japanese_kana_ratio = (char_counts['hiragana'] + char_counts['katakana']) / total_chars
-    kanji_ratio = char_counts['kanji'] / total_chars
-    ascii_ratio = char_counts['ascii'] / total_chars
+    # Classify every character in a single C-level pass, then tally only the
+    # categories each decision below needs, in decision order
+    total_chars = len(text)
+    markers = text.translate(_CATEGORY_TABLE)
     
     # Decision logic with thresholds to avoid false positives
     # Japanese: Even a small percentage of hiragana/katakana is highly indicative
-    if japanese_kana_ratio > 0.05:  # 5% hiragana/katakana = definitely Japanese
+    # Thresholds are compared in integer form: count / total > 1/20  <=>  count * 20 > total
+    kana = markers.count(_HIRAGANA_MARKER) + markers.count(_KATAKANA_MARKER)
+    if kana * 20 > total_chars:  # 5% hiragana/katakana = definitely Japanese
         return "Japanese"
     
     # Pure kanji text: likely Japanese if mostly kanji (though could be Chinese)
     # Since we only support EN/JA/VI, treat high kanji content as Japanese
-    if kanji_ratio > 0.5:  # More than 50% kanji characters
+    if markers.count(_KANJI_MARKER) * 2 > total_chars:  # More than 50% kanji characters
         return "Japanese"
     
     # Vietnamese: Two-tier detection to avoid French/Spanish false positives
     # Tier 1: Any truly unique Vietnamese character (ă, đ, ơ, ư) = Vietnamese
-    if char_counts['vietnamese_unique'] >= 1:
+    if _VIETNAMESE_UNIQUE_MARKER in markers:
         return "Vietnamese"
     
     # Tier 2: Multiple common Vietnamese tone marks (but not French/Spanish single accents)
-    if char_counts['vietnamese_common'] >= 1:  # Even 1 dot-below/hook-above is fairly specific to Vietnamese
+    if _VIETNAMESE_COMMON_MARKER in markers:  # Even 1 dot-below/hook-above is fairly specific to Vietnamese
         return "Vietnamese"
     
-    # English: Majority ASCII letters
-    if ascii_ratio > 0.5:  # 50% ASCII letters
+    # English: Majority ASCII letters, or, if can't confidently detect, any ASCII letter
+    # present; the second case subsumes the first, so no count is needed
+    if _ASCII_LETTER_MARKER in markers:
         return "English"
     
-    # If can't confidently detect, default to English if any ASCII present
-    if char_counts['ascii'] > 0:
-        return "English"
+    return None
+
+
+_detect_language_cached = lru_cache(maxsize=_CACHE_SIZE)(_detect_language)
+
+
+def detect_language_ex(text: str, max_chars: int = 50) -> tuple[str, str, str]:
+    """
+    Extract the first sentence and detect the language of both it and the full text.
     
-    return None
\ No newline at end of file
+    Equivalent to calling extract_first_sentence_for_detection() and detect_language()
+    on the full text and on the extracted sentence, but classifies the sentence only
+    when it differs from the full text.
+    
+    Args:
+        text: Input text
+        max_chars: Maximum characters of the extracted sentence (default: 50)
+        
+    Returns:
+        Tuple of (first_sentence, full_text_language, first_sentence_language). The
+        first-sentence language falls back to the full text when nothing is extracted.
+        
+    Examples:
+        >>> detect_language_ex("Học máy. 機械学習とは何ですか？")
+        ('Học máy.', 'Japanese', 'Vietnamese')
+    """
+    first_sentence = extract_first_sentence_for_detection(text, max_chars)
+    full_lang = detect_language(text)
+    if not first_sentence or first_sentence == text:
+        return first_sentence, full_lang, full_lang
+    return first_sentence, full_lang, detect_language(first_sentence)
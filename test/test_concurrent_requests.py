@@ -7,172 +7,371 @@ Usage:
     python test_concurrent_requests.py --users 10 --requests 5
 """
 import asyncio
-import aiohttp
-import time
 import argparse
-import json
-import statistics
-from typing import List, Dict, Any
+import math
+from array import array
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Awaitable, Tuple
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
+from time import monotonic_ns
 
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
-@dataclass
+if TYPE_CHECKING:
+    # HTTP clients are imported on first use, so --help and argument errors stay fast
+    import aiohttp
+
+# SSE lines are matched and parsed as raw bytes, without decoding each line first
+SSE_DATA_PREFIX = b"data:"
+
+# Every task sends the same question so backend behavior is reproducible across runs;
+# requests are told apart by user_id/request_id in their metrics, not by the prompt
+QUESTION_CHAT = "What is RAGFlow?"
+QUESTION_SEARCH = "What is machine learning?"
+
+# Below this many TTFC samples the interpolated P99 still leans on the single slowest
+# request ((n - 1) * 0.99 > n - 2), so one outlier would decide the blocking verdict
+MIN_BLOCKING_SAMPLES = 101
+
+
+SSE_EVENT_SEPARATOR = b"\n\n"
+
+
+def _normalize_line_endings(buf: bytearray):
+    """Rewrite CRLF and lone CR line endings in buf to LF, as the SSE grammar allows all three"""
+    # A trailing CR may be the first half of a CRLF split across chunks, so it is kept as is
+    end = len(buf) - 1 if buf.endswith(b"\r") else len(buf)
+    if b"\r" in buf[:end]:
+        buf[:end] = buf[:end].replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+
+def _pop_sse_events(buf: bytearray) -> List[bytes]:
+    """Remove the complete SSE events from the front of buf and return them"""
+    _normalize_line_endings(buf)
+    end = buf.rfind(SSE_EVENT_SEPARATOR)
+    if end < 0:
+        return []
+    events = bytes(buf[:end]).split(SSE_EVENT_SEPARATOR)
+    del buf[:end + len(SSE_EVENT_SEPARATOR)]
+    return events
+
+
+def _sse_event_data(event: bytes) -> bytes:
+    """Return the payload of an SSE event, joining multi-line data fields"""
+    if b"\n" not in event:
+        return event[5:].rstrip(b"\r") if event.startswith(SSE_DATA_PREFIX) else b""
+    return b"\n".join(
+        line[5:].rstrip(b"\r") for line in event.split(b"\n") if line.startswith(SSE_DATA_PREFIX)
+    )
+
+
+@dataclass(slots=True)
 class RequestMetrics:
     """Metrics for a single request"""
     user_id: int
     request_id: int
     endpoint: str
-    first_chunk_time: float
-    total_time: float
+    first_chunk_ns: int  # Monotonic nanoseconds from request start; 0 if no chunk arrived
+    total_ns: int
     success: bool
     error: str = ""
-    chunks_received: int = 0
+    chunks_received: int = 0  # Complete SSE events received
+    
+    @property
+    def first_chunk_time(self) -> float:
+        """Time to first chunk in seconds"""
+        return self.first_chunk_ns / 1e9
+    
+    @property
+    def total_time(self) -> float:
+        """Total response time in seconds"""
+        return self.total_ns / 1e9
+
+
+class LatencyStats:
+    """Single-pass latency statistics (Welford mean/variance plus compact samples for percentiles)"""
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._m2 = 0.0
+        self._samples = array("d")
+        self._sorted = None
+    
+    def add(self, value: float):
+        """Add one sample"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self._samples.append(value)
+        self._sorted = None
+    
+    @property
+    def stdev(self) -> float:
+        """Sample standard deviation"""
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+    
+    def percentile(self, p: float) -> float:
+        """Percentile (0-100) with linear interpolation between samples"""
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        rank = (self.count - 1) * p / 100
+        lower = int(rank)
+        upper = min(lower + 1, self.count - 1)
+        return self._sorted[lower] + (self._sorted[upper] - self._sorted[lower]) * (rank - lower)
+    
+    def print_summary(self, title: str):
+        """Print the statistics block used in the test reports"""
+        print(f"{title}:")
+        print(f"  Average: {self.mean:.3f}s")
+        print(f"  Median:  {self.percentile(50):.3f}s")
+        print(f"  P95:     {self.percentile(95):.3f}s")
+        print(f"  P99:     {self.percentile(99):.3f}s")
+        print(f"  Min:     {self.min:.3f}s")
+        print(f"  Max:     {self.max:.3f}s")
+        if self.count > 1:
+            print(f"  StdDev:  {self.stdev:.3f}s")
+        print()
 
 
 class ConcurrencyTester:
     """Test concurrent request handling"""
     
-    def __init__(self, base_url: str, auth_token: str):
+    def __init__(
+        self,
+        base_url: str,
+        auth_token: str,
+        max_connections: int = 256,
+        limit_per_host: int = 0,
+        http_client: str = "aiohttp",
+        progress: bool = False,
+        max_inflight: int = 64,
+        blocking_ratio: float = 3.0,
+        legacy_blocking_check: bool = False
+    ):
         self.base_url = base_url
         self.auth_token = auth_token
-        self.metrics: List[RequestMetrics] = []
+        self.max_connections = max_connections
+        self.limit_per_host = limit_per_host
+        self.http_client = http_client
+        self.progress = progress
+        self.max_inflight = max_inflight
+        # Blocking is flagged when P99 TTFC exceeds the median by this factor; the legacy
+        # check compares the single slowest request to the mean instead
+        self.blocking_ratio = blocking_ratio
+        self.legacy_blocking_check = legacy_blocking_check
+        # One client (and connection pool) shared by every request of every sub-test,
+        # so keep-alive connections are reused instead of re-handshaking per test round
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._httpx_client = None
+        # Created lazily so it is bound to the running event loop
+        self._inflight: Optional[asyncio.Semaphore] = None
     
-    async def chat_request(
+    def _get_inflight_limit(self) -> asyncio.Semaphore:
+        """Return the semaphore bounding the number of in-flight requests"""
+        if self._inflight is None:
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+        return self._inflight
+    
+    async def _get_session(self) -> "aiohttp.ClientSession":
+        """Return the shared aiohttp session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+            
+            # aiohttp's default pool caps at 100 connections, which silently serializes
+            # larger runs; DNS answers are cached so tasks don't re-resolve the host
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300
+            )
+            # No total timeout so long SSE streams aren't cut off, but bound connection setup
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=None)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+    
+    async def _get_httpx_client(self):
+        """Return the shared httpx client, creating it on first use"""
+        if self._httpx_client is None or self._httpx_client.is_closed:
+            import httpx
+            
+            # httpx spells "no limit" as None where aiohttp uses 0
+            max_connections = self.max_connections or None
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+            self._httpx_client = httpx.AsyncClient(
+                limits=limits,
+                timeout=httpx.Timeout(None, connect=10)
+            )
+            # httpcore imports anyio's asyncio backend on the first connection; load it
+            # now so that import (~20ms) isn't timed as the first request's TTFC
+            import anyio
+            await anyio.sleep(0)
+        return self._httpx_client
+    
+    async def _open_client(self):
+        """Create the configured HTTP client before any request is timed"""
+        # The client is imported and built on first use (~100ms for aiohttp); inside a
+        # request that would be counted as its TTFC and look like server-side blocking
+        if self.http_client == "httpx":
+            await self._get_httpx_client()
+        else:
+            await self._get_session()
+    
+    async def aclose(self):
+        """Close the shared HTTP clients"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._httpx_client is not None:
+            await self._httpx_client.aclose()
+        self._httpx_client = None
+    
+    @asynccontextmanager
+    async def _post_stream(self, path: str, payload: Dict[str, Any]):
+        """POST a streaming request; yields (status, async iterator of raw body chunks)"""
+        url = f"{self.base_url}{path}"
+        headers = {"Authorization": self.auth_token}
+        
+        if self.http_client == "httpx":
+            client = await self._get_httpx_client()
+            async with client.stream("POST", url, json=payload, headers=headers) as resp:
+                # aiter_bytes() undoes Content-Encoding (httpx asks for gzip by default)
+                yield resp.status_code, resp.aiter_bytes()
+        else:
+            session = await self._get_session()
+            async with session.post(url, json=payload, headers=headers) as resp:
+                # iter_any() hands over whatever has arrived, instead of one wake-up per line
+                yield resp.status, resp.content.iter_any()
+    
+    async def _stream_request(
         self,
-        session: aiohttp.ClientSession,
+        endpoint: str,
+        path: str,
+        payload: Dict[str, Any],
         user_id: int,
-        request_id: int,
-        conversation_id: str,
-        message: str
+        request_id: int
     ) -> RequestMetrics:
-        """Send a chat completion request and measure response times"""
-        start_time = time.time()
-        first_chunk_time = None
+        """Send a streaming request and measure response times"""
+        start_ns = monotonic_ns()
+        first_chunk_ns = 0
         chunks_received = 0
         success = False
         error = ""
         
         try:
-            async with session.post(
-                f"{self.base_url}/v1/conversation/completion",
-                json={
-                    "conversation_id": conversation_id,
-                    "messages": [
-                        {"role": "user", "content": message}
-                    ],
-                    "stream": True
-                },
-                headers={"Authorization": self.auth_token}
-            ) as resp:
-                if resp.status != 200:
-                    error = f"HTTP {resp.status}"
+            async with self._post_stream(path, payload) as (status, chunks):
+                if status != 200:
+                    error = f"HTTP {status}"
                     return RequestMetrics(
                         user_id=user_id,
                         request_id=request_id,
-                        endpoint="chat",
-                        first_chunk_time=0,
-                        total_time=time.time() - start_time,
+                        endpoint=endpoint,
+                        first_chunk_ns=0,
+                        total_ns=monotonic_ns() - start_ns,
                         success=False,
                         error=error
                     )
                 
-                async for line in resp.content:
-                    if first_chunk_time is None:
-                        first_chunk_time = time.time() - start_time
-                    chunks_received += 1
+                buf = bytearray()
+                async for chunk in chunks:
+                    # TTFC is taken when the first bytes arrive, before any framing
+                    if not first_chunk_ns:
+                        first_chunk_ns = monotonic_ns() - start_ns
+                    buf += chunk
                     
-                    # Process SSE data
-                    line_str = line.decode('utf-8').strip()
-                    if line_str.startswith('data:'):
-                        try:
-                            data = json.loads(line_str[5:])
-                            if data.get("code") == 0 and data.get("data") is True:
-                                success = True
-                        except json.JSONDecodeError:
-                            pass
+                    # Process complete SSE events
+                    for event in _pop_sse_events(buf):
+                        chunks_received += 1
+                        if self._is_final_event(event):
+                            success = True
                 
-                total_time = time.time() - start_time
+                # A last event may end with the stream instead of a blank line
+                if buf.strip():
+                    chunks_received += 1
+                    if self._is_final_event(bytes(buf)):
+                        success = True
+                
+                total_ns = monotonic_ns() - start_ns
                 
         except Exception as e:
             error = str(e)
-            total_time = time.time() - start_time
+            total_ns = monotonic_ns() - start_ns
         
         return RequestMetrics(
             user_id=user_id,
             request_id=request_id,
-            endpoint="chat",
-            first_chunk_time=first_chunk_time or 0,
-            total_time=total_time,
+            endpoint=endpoint,
+            first_chunk_ns=first_chunk_ns,
+            total_ns=total_ns,
             success=success,
             error=error,
             chunks_received=chunks_received
         )
     
+    @staticmethod
+    def _is_final_event(event: bytes) -> bool:
+        """Whether an SSE event is the successful end-of-stream marker"""
+        data = _sse_event_data(event)
+        if not data:
+            return False
+        try:
+            data = _json.loads(data)
+        except _json.JSONDecodeError:
+            return False
+        return isinstance(data, dict) and data.get("code") == 0 and data.get("data") is True
+    
+    async def chat_request(
+        self,
+        user_id: int,
+        request_id: int,
+        conversation_id: str,
+        message: str
+    ) -> RequestMetrics:
+        """Send a chat completion request and measure response times"""
+        return await self._stream_request(
+            "chat",
+            "/v1/conversation/completion",
+            {
+                "conversation_id": conversation_id,
+                "messages": [
+                    {"role": "user", "content": message}
+                ],
+                "stream": True
+            },
+            user_id,
+            request_id
+        )
+    
     async def search_request(
         self,
-        session: aiohttp.ClientSession,
         user_id: int,
         request_id: int,
         kb_ids: List[str],
         question: str
     ) -> RequestMetrics:
         """Send a search/ask request and measure response times"""
-        start_time = time.time()
-        first_chunk_time = None
-        chunks_received = 0
-        success = False
-        error = ""
-        
-        try:
-            async with session.post(
-                f"{self.base_url}/v1/conversation/ask",
-                json={
-                    "question": question,
-                    "kb_ids": kb_ids
-                },
-                headers={"Authorization": self.auth_token}
-            ) as resp:
-                if resp.status != 200:
-                    error = f"HTTP {resp.status}"
-                    return RequestMetrics(
-                        user_id=user_id,
-                        request_id=request_id,
-                        endpoint="search",
-                        first_chunk_time=0,
-                        total_time=time.time() - start_time,
-                        success=False,
-                        error=error
-                    )
-                
-                async for line in resp.content:
-                    if first_chunk_time is None:
-                        first_chunk_time = time.time() - start_time
-                    chunks_received += 1
-                    
-                    line_str = line.decode('utf-8').strip()
-                    if line_str.startswith('data:'):
-                        try:
-                            data = json.loads(line_str[5:])
-                            if data.get("code") == 0 and data.get("data") is True:
-                                success = True
-                        except json.JSONDecodeError:
-                            pass
-                
-                total_time = time.time() - start_time
-                
-        except Exception as e:
-            error = str(e)
-            total_time = time.time() - start_time
-        
-        return RequestMetrics(
-            user_id=user_id,
-            request_id=request_id,
-            endpoint="search",
-            first_chunk_time=first_chunk_time or 0,
-            total_time=total_time,
-            success=success,
-            error=error,
-            chunks_received=chunks_received
+        return await self._stream_request(
+            "search",
+            "/v1/conversation/ask",
+            {
+                "question": question,
+                "kb_ids": kb_ids
+            },
+            user_id,
+            request_id
         )
     
     async def run_test(
@@ -182,107 +381,134 @@ class ConcurrencyTester:
         test_type: str,
         conversation_id: str = None,
         kb_ids: List[str] = None
-    ):
-        """Run concurrent test with specified parameters"""
+    ) -> Tuple[List[RequestMetrics], float]:
+        """Run concurrent test with specified parameters; returns (results, test time in seconds)"""
         print(f"\n{'='*70}")
         print(f"Testing {test_type.upper()} with {num_concurrent_users} concurrent users")
         print(f"Each user sends {requests_per_user} requests")
         print(f"{'='*70}\n")
         
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            
+        results: List[RequestMetrics] = []
+        await self._open_client()
+        
+        # Each result is recorded as soon as its request completes, not after the slowest one
+        start_ns = monotonic_ns()
+        async with asyncio.TaskGroup() as tg:
             for user_id in range(num_concurrent_users):
                 for req_id in range(requests_per_user):
                     if test_type == "chat":
-                        task = self.chat_request(
-                            session,
-                            user_id,
-                            req_id,
-                            conversation_id,
-                            f"User {user_id} request {req_id}: What is RAGFlow?"
-                        )
+                        request = self.chat_request(user_id, req_id, conversation_id, QUESTION_CHAT)
                     else:  # search
-                        task = self.search_request(
-                            session,
-                            user_id,
-                            req_id,
-                            kb_ids,
-                            f"User {user_id} request {req_id}: What is machine learning?"
-                        )
-                    tasks.append(task)
-            
-            # Execute all requests concurrently
-            start_time = time.time()
-            results = await asyncio.gather(*tasks)
-            total_test_time = time.time() - start_time
-            
-            self.metrics.extend(results)
-            
-            # Print results
-            self._print_results(results, total_test_time, test_type)
+                        request = self.search_request(user_id, req_id, kb_ids, QUESTION_SEARCH)
+                    tg.create_task(self._run_one(request, results))
+        total_test_time = (monotonic_ns() - start_ns) / 1e9
+        
+        return results, total_test_time
+    
+    async def _run_one(self, request: Awaitable[RequestMetrics], results: List[RequestMetrics]):
+        """Await a single request and record its metrics"""
+        # Timing starts inside the request coroutine, i.e. only once a slot is acquired,
+        # so client-side queuing is not measured as server latency
+        async with self._get_inflight_limit():
+            metric = await request
+        self._on_result(metric, results)
+    
+    def _on_result(self, metric: RequestMetrics, results: List[RequestMetrics]):
+        """Record a completed request, optionally logging it"""
+        results.append(metric)
+        if self.progress:
+            status = "OK " if metric.success else "ERR"
+            print(
+                f"  [{len(results):>5}] {status} {metric.endpoint} user={metric.user_id} "
+                f"req={metric.request_id} ttfc={metric.first_chunk_time:.3f}s total={metric.total_time:.3f}s"
+            )
     
-    def _print_results(self, results: List[RequestMetrics], total_test_time: float, test_type: str):
+    def print_results(self, results: List[RequestMetrics], total_test_time: float, test_type: str):
         """Print test results with statistics"""
-        successful = [r for r in results if r.success]
-        failed = [r for r in results if not r.success]
+        # Single pass over the results: split, timings and error counts together
+        ttfc_stats = LatencyStats()
+        total_stats = LatencyStats()
+        error_counts = {}
+        for r in results:
+            if r.success:
+                if r.first_chunk_ns > 0:
+                    ttfc_stats.add(r.first_chunk_time)
+                total_stats.add(r.total_time)
+            else:
+                error_counts[r.error] = error_counts.get(r.error, 0) + 1
         
-        first_chunk_times = [r.first_chunk_time for r in successful if r.first_chunk_time > 0]
-        total_times = [r.total_time for r in successful]
+        total = len(results)
+        successful = total_stats.count
+        failed = total - successful
         
         print(f"\n{test_type.upper()} Test Results:")
         print(f"{'='*70}")
-        print(f"Total requests: {len(results)}")
-        print(f"Successful: {len(successful)} ({len(successful)/len(results)*100:.1f}%)")
-        print(f"Failed: {len(failed)} ({len(failed)/len(results)*100:.1f}%)")
+        print(f"Total requests: {total}")
+        print(f"Successful: {successful} ({successful/total*100:.1f}%)")
+        print(f"Failed: {failed} ({failed/total*100:.1f}%)")
         print(f"Total test time: {total_test_time:.2f}s")
         print()
         
-        if first_chunk_times:
-            print(f"Time to First Chunk (TTFC):")
-            print(f"  Average: {statistics.mean(first_chunk_times):.3f}s")
-            print(f"  Median:  {statistics.median(first_chunk_times):.3f}s")
-            print(f"  Min:     {min(first_chunk_times):.3f}s")
-            print(f"  Max:     {max(first_chunk_times):.3f}s")
-            if len(first_chunk_times) > 1:
-                print(f"  StdDev:  {statistics.stdev(first_chunk_times):.3f}s")
-            print()
+        if ttfc_stats.count:
+            ttfc_stats.print_summary("Time to First Chunk (TTFC)")
         
-        if total_times:
-            print(f"Total Response Time:")
-            print(f"  Average: {statistics.mean(total_times):.3f}s")
-            print(f"  Median:  {statistics.median(total_times):.3f}s")
-            print(f"  Min:     {min(total_times):.3f}s")
-            print(f"  Max:     {max(total_times):.3f}s")
-            if len(total_times) > 1:
-                print(f"  StdDev:  {statistics.stdev(total_times):.3f}s")
-            print()
+        if total_stats.count:
+            total_stats.print_summary("Total Response Time")
         
         if failed:
             print(f"Failed Requests:")
-            error_counts = {}
-            for r in failed:
-                error_counts[r.error] = error_counts.get(r.error, 0) + 1
             for error, count in error_counts.items():
                 print(f"  {error}: {count} requests")
             print()
         
         # Check for blocking behavior
-        if len(first_chunk_times) > 1:
-            avg_ttfc = statistics.mean(first_chunk_times)
-            max_ttfc = max(first_chunk_times)
-            
-            if max_ttfc > avg_ttfc * 2:
-                print("⚠️  WARNING: Detected blocking behavior!")
-                print(f"   Max TTFC ({max_ttfc:.3f}s) is > 2x average ({avg_ttfc:.3f}s)")
-                print(f"   This suggests requests are blocking each other.")
+        if ttfc_stats.count > 1:
+            if self.legacy_blocking_check:
+                avg_ttfc = ttfc_stats.mean
+                max_ttfc = ttfc_stats.max
+                
+                if max_ttfc > avg_ttfc * 2:
+                    print("⚠️  WARNING: Detected blocking behavior!")
+                    print(f"   Max TTFC ({max_ttfc:.3f}s) is > 2x average ({avg_ttfc:.3f}s)")
+                    print(f"   This suggests requests are blocking each other.")
+                else:
+                    print("✅ Good: Requests appear to be handled concurrently")
+                    print(f"   Max TTFC ({max_ttfc:.3f}s) is within 2x of average ({avg_ttfc:.3f}s)")
+            elif ttfc_stats.count < MIN_BLOCKING_SAMPLES:
+                _print_insufficient_samples(ttfc_stats.count)
             else:
-                print("✅ Good: Requests appear to be handled concurrently")
-                print(f"   Max TTFC ({max_ttfc:.3f}s) is within 2x of average ({avg_ttfc:.3f}s)")
+                # Tail vs median: a single GC pause or cold TLS handshake can't flip the verdict
+                p50_ttfc = ttfc_stats.percentile(50)
+                p99_ttfc = ttfc_stats.percentile(99)
+                ratio = self.blocking_ratio
+                
+                if p99_ttfc > p50_ttfc * ratio:
+                    print("⚠️  WARNING: Detected blocking behavior!")
+                    print(f"   P99 TTFC ({p99_ttfc:.3f}s) is > {ratio:g}x median ({p50_ttfc:.3f}s)")
+                    print(f"   This suggests requests are blocking each other.")
+                else:
+                    print("✅ Good: Requests appear to be handled concurrently")
+                    print(f"   P99 TTFC ({p99_ttfc:.3f}s) is within {ratio:g}x of median ({p50_ttfc:.3f}s)")
             print()
 
 
-def main():
+def _print_insufficient_samples(count: int):
+    """Print why no P99-based blocking verdict is given"""
+    print(f"ℹ️  Insufficient samples for a blocking verdict ({count} TTFC samples, need {MIN_BLOCKING_SAMPLES})")
+    print(f"   Increase --users/--requests, or use --legacy-blocking-check.")
+
+
+def _run_event_loop(coro):
+    """Run coro on uvloop when it is installed, else on the default asyncio loop"""
+    try:
+        import uvloop
+    except ImportError:  # Not installed, or unsupported platform such as Windows
+        return asyncio.run(coro)
+    return asyncio.run(coro, loop_factory=uvloop.new_event_loop)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments and resolve derived defaults"""
     parser = argparse.ArgumentParser(
         description="Test concurrent request handling in RAGFlow"
     )
@@ -322,65 +548,166 @@ def main():
         "--kb-ids",
         help="Comma-separated KB IDs for search tests"
     )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        help="Connection pool size, 0 for no limit (default: max(users * requests * test types, 256))"
+    )
+    parser.add_argument(
+        "--limit-per-host",
+        type=int,
+        default=0,
+        help="Max connections per host, 0 for no limit (default: 0)"
+    )
+    parser.add_argument(
+        "--http-client",
+        choices=["aiohttp", "httpx"],
+        default="aiohttp",
+        help="HTTP client used to stream responses (default: aiohttp)"
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        help="Max requests in flight at once (default: users * test types)"
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Print each request's result as it completes"
+    )
+    parser.add_argument(
+        "--blocking-ratio",
+        type=float,
+        default=3.0,
+        help=f"Flag blocking when P99 TTFC exceeds the median by this factor; needs at least "
+             f"{MIN_BLOCKING_SAMPLES} TTFC samples (default: 3.0)"
+    )
+    parser.add_argument(
+        "--legacy-blocking-check",
+        action="store_true",
+        help="Flag blocking from max vs average TTFC instead of P99 vs median"
+    )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
-    tester = ConcurrencyTester(args.url, args.token)
+    args.kb_ids = args.kb_ids.split(",") if args.kb_ids else []
+    # With --test-type both, chat and search run at the same time and share one pool
+    test_types = 2 if args.test_type == "both" else 1
+    if args.max_connections is None:
+        args.max_connections = max(args.users * args.requests * test_types, 256)
+    if args.max_inflight is None:
+        args.max_inflight = args.users * test_types
+    elif args.max_inflight <= 0:
+        parser.error("--max-inflight must be a positive integer")
+    return args
+
+
+async def run(args: argparse.Namespace):
+    """Run the selected tests, closing the HTTP clients afterwards"""
+    tester = ConcurrencyTester(
+        args.url,
+        args.token,
+        args.max_connections,
+        args.limit_per_host,
+        args.http_client,
+        args.progress,
+        args.max_inflight,
+        args.blocking_ratio,
+        args.legacy_blocking_check
+    )
+    try:
+        await _run_tests(tester, args)
+    finally:
+        await tester.aclose()
+
+
+async def _run_tests(tester: ConcurrencyTester, args: argparse.Namespace):
+    """Run the selected sub-tests concurrently, then print their reports and the overall summary"""
+    run_chat = args.test_type in ["chat", "both"]
+    run_search = args.test_type in ["search", "both"]
+    if run_chat and not args.conversation_id:
+        print("ERROR: --conversation-id required for chat tests")
+        return
+    if run_search and not args.kb_ids:
+        print("ERROR: --kb-ids required for search tests")
+        return
     
-    kb_ids = args.kb_ids.split(",") if args.kb_ids else []
+    test_types = []
+    runs = []
+    if run_chat:
+        test_types.append("chat")
+        runs.append(tester.run_test(
+            args.users,
+            args.requests,
+            "chat",
+            conversation_id=args.conversation_id
+        ))
+    if run_search:
+        test_types.append("search")
+        runs.append(tester.run_test(
+            args.users,
+            args.requests,
+            "search",
+            kb_ids=args.kb_ids
+        ))
     
-    async def run_tests():
-        if args.test_type in ["chat", "both"]:
-            if not args.conversation_id:
-                print("ERROR: --conversation-id required for chat tests")
-                return
-            await tester.run_test(
-                args.users,
-                args.requests,
-                "chat",
-                conversation_id=args.conversation_id
-            )
-        
-        if args.test_type in ["search", "both"]:
-            if not kb_ids:
-                print("ERROR: --kb-ids required for search tests")
-                return
-            await tester.run_test(
-                args.users,
-                args.requests,
-                "search",
-                kb_ids=kb_ids
-            )
-        
-        # Overall summary
-        print(f"\n{'='*70}")
-        print(f"OVERALL TEST SUMMARY")
-        print(f"{'='*70}")
-        
-        all_successful = [m for m in tester.metrics if m.success]
-        all_failed = [m for m in tester.metrics if not m.success]
-        all_ttfc = [m.first_chunk_time for m in all_successful if m.first_chunk_time > 0]
-        
-        print(f"Total requests: {len(tester.metrics)}")
-        print(f"Success rate: {len(all_successful)/len(tester.metrics)*100:.1f}%")
+    # Interleave the endpoints on the shared client, as mixed production traffic would,
+    # and print each report only once everything has finished
+    outcomes = await asyncio.gather(*runs)
+    all_metrics: List[RequestMetrics] = []
+    for test_type, (results, total_test_time) in zip(test_types, outcomes):
+        tester.print_results(results, total_test_time, test_type)
+        all_metrics.extend(results)
+    
+    # Overall summary
+    print(f"\n{'='*70}")
+    print(f"OVERALL TEST SUMMARY")
+    print(f"{'='*70}")
+    
+    all_successful = 0
+    all_ttfc = LatencyStats()
+    for m in all_metrics:
+        if m.success:
+            all_successful += 1
+            if m.first_chunk_ns > 0:
+                all_ttfc.add(m.first_chunk_time)
+    
+    print(f"Total requests: {len(all_metrics)}")
+    print(f"Success rate: {all_successful/len(all_metrics)*100:.1f}%")
+    
+    if all_ttfc.count:
+        print(f"\nConcurrent Performance:")
+        print(f"  Average TTFC: {all_ttfc.mean:.3f}s")
+        print(f"  Median TTFC: {all_ttfc.percentile(50):.3f}s")
+        print(f"  P99 TTFC: {all_ttfc.percentile(99):.3f}s")
+        print(f"  Max TTFC: {all_ttfc.max:.3f}s")
+        print(f"  Spread: {all_ttfc.max - all_ttfc.min:.3f}s")
         
-        if all_ttfc:
-            print(f"\nConcurrent Performance:")
-            print(f"  Average TTFC: {statistics.mean(all_ttfc):.3f}s")
-            print(f"  Max TTFC: {max(all_ttfc):.3f}s")
-            print(f"  Spread: {max(all_ttfc) - min(all_ttfc):.3f}s")
-            
-            if max(all_ttfc) > statistics.mean(all_ttfc) * 3:
-                print(f"\n❌ PERFORMANCE ISSUE DETECTED")
-                print(f"   Some requests took 3x+ longer than average")
-                print(f"   Blocking operations may be present")
-            else:
-                print(f"\n✅ GOOD CONCURRENT PERFORMANCE")
-                print(f"   Requests handled efficiently")
+        if tester.legacy_blocking_check:
+            blocking = all_ttfc.max > all_ttfc.mean * 3
+            detail = "Some requests took 3x+ longer than average"
+        elif all_ttfc.count < MIN_BLOCKING_SAMPLES:
+            blocking = None
+        else:
+            blocking = all_ttfc.percentile(99) > all_ttfc.percentile(50) * tester.blocking_ratio
+            detail = f"P99 TTFC is {tester.blocking_ratio:g}x+ the median"
         
-        print()
+        if blocking is None:
+            print()
+            _print_insufficient_samples(all_ttfc.count)
+        elif blocking:
+            print(f"\n❌ PERFORMANCE ISSUE DETECTED")
+            print(f"   {detail}")
+            print(f"   Blocking operations may be present")
+        else:
+            print(f"\n✅ GOOD CONCURRENT PERFORMANCE")
+            print(f"   Requests handled efficiently")
     
-    asyncio.run(run_tests())
+    print()
+
+
+def main():
+    _run_event_loop(run(parse_args()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Tests for the concurrency tester script (test/test_concurrent_requests.py),
+run against a local SSE stub server.
+"""
+
+import asyncio
+import importlib.util
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+# The tester is a standalone script rather than a package module
+_SPEC = importlib.util.spec_from_file_location(
+    "concurrent_requests_tester",
+    Path(__file__).resolve().parents[1] / "test_concurrent_requests.py"
+)
+tester_module = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(tester_module)
+
+# Fixed server-side delay before the first event, so every request has the same TTFC
+STUB_FIRST_EVENT_DELAY = 0.05
+# Stands in for the client import of a fresh process, which the test process has already
+# paid; like an import, it blocks the event loop, so only the request that triggers it waits
+SLOW_CLIENT_SETUP_DELAY = 0.2
+
+
+async def _sse(request):
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await resp.prepare(request)
+    await asyncio.sleep(STUB_FIRST_EVENT_DELAY)
+    await resp.write(b"data:" + json.dumps({"code": 0, "data": {"answer": "x"}}).encode() + b"\n\n")
+    await resp.write(b"data:" + json.dumps({"code": 0, "data": True}).encode() + b"\n\n")
+    return resp
+
+
+async def _run_against_stub(http_client):
+    app = web.Application()
+    app.router.add_post("/v1/conversation/completion", _sse)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    tester = tester_module.ConcurrencyTester(
+        f"http://127.0.0.1:{port}", "token", http_client=http_client, max_inflight=6
+    )
+    try:
+        results, _ = await tester.run_test(3, 2, "chat", conversation_id="c")
+    finally:
+        await tester.aclose()
+        await runner.cleanup()
+    return results
+
+
+class TestConcurrencyTester:
+    """Test the concurrency tester against a stub with uniform latency"""
+
+    @pytest.mark.parametrize("http_client,getter,client_attr", [
+        ("aiohttp", "_get_session", "_session"),
+        ("httpx", "_get_httpx_client", "_httpx_client"),
+    ])
+    def test_first_request_ttfc_not_outlier(self, monkeypatch, http_client, getter, client_attr):
+        """Test that client import and setup are not timed as the first request's TTFC"""
+        if http_client == "httpx":
+            pytest.importorskip("httpx")
+        original = getattr(tester_module.ConcurrencyTester, getter)
+
+        async def slow_getter(self):
+            if getattr(self, client_attr) is None:
+                time.sleep(SLOW_CLIENT_SETUP_DELAY)
+            return await original(self)
+
+        monkeypatch.setattr(tester_module.ConcurrencyTester, getter, slow_getter)
+        results = asyncio.run(_run_against_stub(http_client))
+
+        assert all(r.success for r in results)
+        ttfc = sorted(r.first_chunk_time for r in results)
+        median = ttfc[len(ttfc) // 2]
+        assert ttfc[-1] < median * 2
@@ -0,0 +1,139 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for language detection utility functions.
+"""
+
+import pytest
+from api.utils.language_utils import (
+    detect_language,
+    detect_language_ex,
+    extract_first_sentence_for_detection,
+)
+
+
+class TestExtractFirstSentence:
+    """Test first-sentence extraction used before language detection"""
+
+    @pytest.mark.parametrize("text,expected", [
+        ("What is 'machine learning'?", "What is ?"),
+        ("Explain NDA concept. More text here.", "Explain concept."),
+        ("機械学習とは何ですか？\n次の文。", "機械学習とは何ですか？"),
+        ("Tell me about NASA and 'space exploration'\nSecond line here", "Tell me about and"),
+        ("「日本語」の「引用符」を使う文章です。", "のを使う文章です。"),
+        ("He said “hello there” to me", "He said to me"),
+        ("It‘s fine’ now", "It now"),
+        ("What's up", "What's up"),
+        ("Don't say \"won't\" here", "Don't say here"),
+        ("What's the \"user's guide\" for", "What's the for"),
+        ("I'm reading \"Harry's book\"", "I'm reading"),
+        ("VIỆT NAM là gì", "VIỆT là gì"),
+    ])
+    def test_extraction(self, text, expected):
+        """Test quote, acronym, and delimiter handling"""
+        assert extract_first_sentence_for_detection(text) == expected
+
+    @pytest.mark.parametrize("text", ["", "   ", "\n\t", None])
+    def test_empty_input(self, text):
+        """Test that blank input returns an empty string"""
+        assert extract_first_sentence_for_detection(text) == ""
+
+    def test_max_chars_limit(self):
+        """Test that long sentences are truncated before cleanup"""
+        text = "This is a very long question that exceeds the fifty character limit"
+        assert extract_first_sentence_for_detection(text) == text[:50].strip()
+        assert extract_first_sentence_for_detection(text, max_chars=7) == "This is"
+
+
+class TestDetectLanguage:
+    """Test character-based language detection"""
+
+    @pytest.mark.parametrize("text,expected", [
+        ("What is machine learning?", "English"),
+        ("機械学習とは何ですか？", "Japanese"),
+        ("カタカナのテスト", "Japanese"),
+        ("日本語", "Japanese"),
+        ("東京タワー", "Japanese"),
+        ("Học máy là gì?", "Vietnamese"),
+        ("Xin chào, bạn khỏe không?", "Vietnamese"),
+        ("Bonjour, comment ça va?", "English"),
+        ("El niño come comida española", "English"),
+        ("Das Mädchen ist schön", "English"),
+    ])
+    def test_detection(self, text, expected):
+        """Test detection of supported languages"""
+        assert detect_language(text) == expected
+
+    @pytest.mark.parametrize("text", ["", "   ", "12345 !?", "Привет мир"])
+    def test_undetermined(self, text):
+        """Test that blank or unsupported input returns None"""
+        assert detect_language(text) is None
+
+    def test_kana_threshold(self):
+        """Test that a small share of kana decides Japanese over Vietnamese"""
+        assert detect_language("ă" + "x" * 10 + "の") == "Japanese"
+        assert detect_language("ă" + "x" * 30 + "の") == "Vietnamese"
+
+    @pytest.mark.parametrize("text,expected", [
+        ("What is machine learning? ", "English"),
+        ("機械学習とは何ですか？", "Japanese"),
+        ("人工知能 ", "Japanese"),
+        ("Học máy là gì? ", "Vietnamese"),
+        ("Das Mädchen ist schön. ", "English"),
+        ("12345 !? ", None),
+    ])
+    def test_long_text(self, text, expected):
+        """Test that long inputs are classified like their short counterparts"""
+        assert detect_language(text * 50) == expected
+
+    def test_cache_bypass_for_long_text(self):
+        """Test that texts above the cache length limit are still classified"""
+        text = "データベース " * 1000
+        assert detect_language(text) == "Japanese"
+        assert extract_first_sentence_for_detection(text) == text[:50].strip()
+
+    def test_sampled_long_text(self):
+        """Test that very long texts are classified from start, middle and end samples"""
+        assert detect_language("x" * 10000 + "ありがとう" * 100 + "x" * 10000) == "Japanese"
+        assert detect_language("人工知能" * 5000) == "Japanese"
+        assert detect_language("Học máy là gì? " * 2000) == "Vietnamese"
+
+
+class TestDetectLanguageEx:
+    """Test fused first-sentence extraction and detection"""
+
+    @pytest.mark.parametrize("text", [
+        "What is 'machine learning'? This is second sentence.",
+        "Học máy. 機械学習とは何ですか？",
+        "Tell me about NASA and 'space exploration'\nSecond line here",
+        "「日本語」の「引用符」を使う文章です。",
+        "日本語",
+        "'quoted'",
+        "",
+    ])
+    def test_matches_separate_calls(self, text):
+        """Test that the result matches calling the separate helpers"""
+        extracted = extract_first_sentence_for_detection(text)
+        assert detect_language_ex(text) == (
+            extracted,
+            detect_language(text),
+            detect_language(extracted if extracted else text),
+        )
+
+    def test_max_chars(self):
+        """Test that max_chars is forwarded to sentence extraction"""
+        assert detect_language_ex("This is a sentence", max_chars=7) == ("This is", "English", "English")
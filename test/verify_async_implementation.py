@@ -3,50 +3,93 @@
 Quick verification that async_retrieval is being called correctly
 """
 
+import asyncio
+import mmap
+import os
 import re
 import sys
-from pathlib import Path
+
+# Combined regexes, keyed by the tuple of source patterns they were built from
+_COMPILED = {}
+
+def _compile_patterns(patterns):
+    """Compile patterns into one bytes alternation with a named group per pattern"""
+    key = tuple(pattern for pattern, _ in patterns)
+    combined = _COMPILED.get(key)
+    if combined is None:
+        # All checked patterns are ASCII, so they can match the raw file bytes directly
+        combined = _COMPILED[key] = re.compile(
+            b'|'.join(b'(?P<p%d>%s)' % (i, pattern.encode('ascii')) for i, pattern in enumerate(key)),
+            re.MULTILINE
+        )
+    return combined
 
 def check_file(filepath, patterns):
     """Check if file contains expected patterns"""
-    content = Path(filepath).read_text(encoding='utf-8')
+    # One alternation scanned once over the memory-mapped file: no per-pattern passes
+    # and no UTF-8 decode of the whole file (the checked patterns never overlap)
+    combined = _compile_patterns(patterns)
+    matches = [[] for _ in patterns]
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                for match in combined.finditer(content):
+                    matches[int(match.lastgroup[1:])].append(match.group().decode('utf-8', 'replace'))
+    
     results = []
-    for pattern, description in patterns:
-        matches = re.findall(pattern, content, re.MULTILINE)
+    for (pattern, description), found in zip(patterns, matches):
         results.append({
             'pattern': description,
-            'found': len(matches),
-            'matches': matches[:3] if matches else []
+            'found': len(found),
+            'matches': found[:3]
         })
     return results
 
-def main():
-    print("=" * 80)
-    print("ASYNC RETRIEVAL IMPLEMENTATION VERIFICATION")
-    print("=" * 80)
-    
-    # Check search.py has async_retrieval
-    print("\n✓ Checking rag/nlp/search.py...")
+def _run_event_loop(coro):
+    """Run coro on uvloop if available"""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(coro)
+    return asyncio.run(coro, loop_factory=uvloop.new_event_loop)
+
+async def main():
     search_patterns = [
         (r'async def async_retrieval\(', 'async_retrieval method defined'),
         (r'await self\.async_rerank_by_model\(', 'calls async_rerank_by_model'),
         (r'sres = await loop\.run_in_executor', 'search wrapped in executor'),
     ]
+    dialog_patterns = [
+        (r'await retriever\.async_retrieval\(', 'calls async_retrieval'),
+        (r'await settings\.retriever\.async_retrieval\(', 'calls settings.retriever.async_retrieval'),
+        (r'loop\.run_in_executor.*retriever\.retrieval[^_]', 'OLD sync retrieval in executor (should be minimal)'),
+    ]
+    rerank_patterns = [
+        (r'async def async_similarity\(', 'async_similarity methods'),
+        (r'self\.async_client = httpx\.AsyncClient', 'httpx AsyncClient initialized'),
+        (r'await self\.async_client\.post\(', 'async HTTP calls'),
+    ]
+    
+    # The files are independent, so scan them concurrently in worker threads
+    # and print the report afterwards in a fixed order
+    search_results, dialog_results, rerank_results = await asyncio.gather(
+        asyncio.to_thread(check_file, 'rag/nlp/search.py', search_patterns),
+        asyncio.to_thread(check_file, 'api/db/services/dialog_service.py', dialog_patterns),
+        asyncio.to_thread(check_file, 'rag/llm/rerank_model.py', rerank_patterns),
+    )
+    
+    print("=" * 80)
+    print("ASYNC RETRIEVAL IMPLEMENTATION VERIFICATION")
+    print("=" * 80)
     
-    search_results = check_file('rag/nlp/search.py', search_patterns)
+    # Check search.py has async_retrieval
+    print("\n✓ Checking rag/nlp/search.py...")
     for result in search_results:
         status = "✅" if result['found'] > 0 else "❌"
         print(f"  {status} {result['pattern']}: {result['found']} occurrences")
     
     # Check dialog_service.py uses async_retrieval
     print("\n✓ Checking api/db/services/dialog_service.py...")
-    dialog_patterns = [
-        (r'await retriever\.async_retrieval\(', 'calls async_retrieval'),
-        (r'await settings\.retriever\.async_retrieval\(', 'calls settings.retriever.async_retrieval'),
-        (r'loop\.run_in_executor.*retriever\.retrieval[^_]', 'OLD sync retrieval in executor (should be minimal)'),
-    ]
-    
-    dialog_results = check_file('api/db/services/dialog_service.py', dialog_patterns)
     for result in dialog_results:
         if 'OLD' in result['pattern']:
             status = "✅" if result['found'] <= 1 else "⚠️"  # 1 is OK (DeepResearcher)
@@ -57,13 +100,6 @@ def main():
     
     # Check rerank_model.py has async_similarity
     print("\n✓ Checking rag/llm/rerank_model.py...")
-    rerank_patterns = [
-        (r'async def async_similarity\(', 'async_similarity methods'),
-        (r'self\.async_client = httpx\.AsyncClient', 'httpx AsyncClient initialized'),
-        (r'await self\.async_client\.post\(', 'async HTTP calls'),
-    ]
-    
-    rerank_results = check_file('rag/llm/rerank_model.py', rerank_patterns)
     for result in rerank_results:
         status = "✅" if result['found'] >= 7 else "⚠️"  # Should have 7+ (OpenAI, Jina, Xinference, LocalAI, Nvidia, SILICONFLOW, GPUStack)
         print(f"  {status} {result['pattern']}: {result['found']} occurrences (7+ expected)")
@@ -93,7 +129,7 @@ def main():
 
 if __name__ == '__main__':
     try:
-        sys.exit(main())
+        sys.exit(_run_event_loop(main()))
     except FileNotFoundError as e:
         print(f"❌ Error: {e}")
         print("Please run this script from the ragflow-be-share directory")
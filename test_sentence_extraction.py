@@ -1,7 +1,7 @@
 """
 Test script to verify extract_first_sentence_for_detection functionality
 """
-from api.utils.language_utils import extract_first_sentence_for_detection, detect_language
+from api.utils.language_utils import detect_language_ex
 
 
 def test_sentence_extraction():
@@ -48,9 +48,7 @@ def test_sentence_extraction():
     
     for i, test in enumerate(test_cases, 1):
         input_text = test["input"]
-        extracted = extract_first_sentence_for_detection(input_text)
-        original_lang = detect_language(input_text)
-        extracted_lang = detect_language(extracted if extracted else input_text)
+        extracted, original_lang, extracted_lang = detect_language_ex(input_text)
         
         print(f"\n{i}. {test['description']}")
         print(f"   Input:     {input_text[:70]}{'...' if len(input_text) > 70 else ''}")